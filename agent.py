@@ -1,72 +1,439 @@
-from typing import List, Dict, Any, Optional
-from openai import AsyncOpenAI
+from typing import List, Dict, Any, Optional, Set, Tuple
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+from itertools import chain
+from openai import AsyncOpenAI, RateLimitError
+from openai.types.chat import ChatCompletion
+from pydantic import BaseModel, ValidationError
 from config import settings
-from tools.user_input import UserPreferences
-from tools.recipe import RecipeAPI, Recipe
-from tools.shopping_list import ShoppingList, calculate_servings_multiplier, calculate_optimal_servings_distribution
+from tools.user_input import UserPreferences, validate_preferences
+from tools.recipe import Recipe, get_recipe_api, close_recipe_api
+from tools import llm_cache
+from tools.shopping_list import ShoppingList, calculate_optimal_servings_distribution
 import asyncio
+import contextlib
+import hashlib
 import json
 import os
+import random
+import re
+import sys
+import uuid
 import httpx
 import logging
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    def canonical_json(obj: Any) -> bytes:
+        """Serialize obj to compact JSON with sorted keys."""
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    
+    def json_dumps(obj: Any) -> str:
+        """Serialize obj to a compact JSON string."""
+        return orjson.dumps(obj).decode()
+    
+    json_loads = orjson.loads
+else:
+    def canonical_json(obj: Any) -> bytes:
+        """Serialize obj to compact JSON with sorted keys."""
+        return json.dumps(obj, sort_keys=True, separators=(",", ":")).encode()
+    
+    def json_dumps(obj: Any) -> str:
+        """Serialize obj to a compact JSON string."""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+    
+    json_loads = json.loads
+
 # Set OpenAI API key in environment
 os.environ["OPENAI_API_KEY"] = settings.OPENAI_API_KEY
 
 logger = logging.getLogger(__name__)
 
-class MealPlannerAgent:
-    """Main agent class for meal planning."""
-    
-    def __init__(self):
-        self.recipe_api = RecipeAPI()
-        self.shopping_list = ShoppingList()
-        self.user_preferences = None
-        
-        # Create custom httpx client without proxy settings
-        http_client = httpx.AsyncClient(
+# Function the assistant calls once the user has confirmed their preferences,
+# so the preferences arrive with the conversation turn instead of needing a
+# separate extraction request
+PREFERENCES_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "submit_preferences",
+        "description": "Submit the meal planning preferences the user has confirmed.",
+        # Structured outputs: the arguments are guaranteed to match the schema
+        "strict": True,
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "meal_count": {"type": "integer", "description": "Number of meals needed for the week"},
+                "dietary_restrictions": {"type": "array", "items": {"type": "string"}},
+                "cuisine_preferences": {"type": "array", "items": {"type": "string"}},
+                "cooking_days": {"type": "array", "items": {"type": "string"}},
+                "servings_per_meal": {"type": "integer"}
+            },
+            "required": ["meal_count", "dietary_restrictions", "cuisine_preferences", "cooking_days", "servings_per_meal"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# System prompts are kept byte-identical across calls, with anything that varies
+# in the user message, so OpenAI can reuse the cached prompt prefix
+COLLECT_SYSTEM_PROMPT = """You are a helpful meal planning assistant.
+Your task is to collect the following information in a friendly, conversational way:
+1. Number of meals they need for the week
+2. Cuisine preferences (Italian, Mexican, Asian, etc.)
+3. Any dietary restrictions (vegetarian, vegan, gluten-free, etc.)
+4. Days they're available to cook
+5. Number of servings per meal
+
+Start by welcoming them and asking about the number of meals.
+Be friendly and conversational while efficiently collecting information.
+After collecting all information, summarize it and ask for confirmation.
+When the user confirms, call the submit_preferences function with their preferences.
+If they have no dietary restrictions or cuisine preferences, pass an empty list."""
+
+# Opening of every preference conversation, shared rather than rebuilt per session
+COLLECT_OPENING_MESSAGES = (
+    {"role": "system", "content": COLLECT_SYSTEM_PROMPT},
+    {"role": "assistant", "content": "Hi! I'm here to help you plan your meals for the week. Let's start with how many meals you'd like to prepare. How many dinners would you like to plan?"}
+)
+
+SELECTION_SYSTEM_PROMPT = """Determine if the user is selecting recipes or requesting more recipes.
+The user message lists the available recipes followed by the user's reply.
+
+If selecting recipes:
+Set selected_indices to the numbers of the selected recipes and more_recipes_query to null.
+
+If requesting more recipes:
+Set selected_indices to [] and more_recipes_query to the search term.
+
+If unclear:
+Set selected_indices to [] and more_recipes_query to null."""
+
+SELECTION_SYSTEM_MESSAGE = {"role": "system", "content": SELECTION_SYSTEM_PROMPT}
+
+SUMMARY_SYSTEM_MESSAGE = {"role": "system", "content": """Summarize this part of a meal planning conversation in a few sentences.
+Keep every preference the user stated (meal count, cuisines, dietary restrictions, cooking days, servings) and anything still unresolved."""}
+
+# Starts the system message that replaces turns folded into a summary
+SUMMARY_PREFIX = "Summary of the conversation so far: "
+
+# Structured output format for the selection interpreter
+SELECTION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "recipe_selection",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "selected_indices": {"type": "array", "items": {"type": "integer"}},
+                "more_recipes_query": {"type": ["string", "null"]}
+            },
+            "required": ["selected_indices", "more_recipes_query"],
+            "additionalProperties": False
+        }
+    }
+}
+
+class RecipeSelection(BaseModel):
+    """Parsed reply from the selection interpreter."""
+    selected_indices: List[int]
+    more_recipes_query: Optional[str] = None
+
+# Edamam cuisine types, spotted in user messages so their searches can start
+# before the preferences are confirmed
+CUISINE_PATTERN = re.compile(
+    r"\b(american|asian|british|caribbean|chinese|french|greek|indian|italian|japanese|"
+    r"korean|mediterranean|mexican|middle eastern|nordic|south american|south east asian)\b",
+    re.IGNORECASE
+)
+
+# Replies made only of recipe numbers and filler ("2 and 4", "#1, #3 please"),
+# the only ones safe to read locally; a digit anywhere else ("3 more chicken
+# recipes", "the 3-bean chili", "not 3") needs the model
+NUMBERED_SELECTION_PATTERN = re.compile(
+    r"(?=.*\d)(?:\s|[,;&+#.!]|\d|(?:and|numbers?|please)(?![a-z]))+",
+    re.IGNORECASE
+)
+
+# Requests like "show me more chicken recipes", answered without the model
+MORE_RECIPES_PATTERN = re.compile(
+    r"\s*(?:(?:can\s+you\s+|please\s+)?show\s+(?:me\s+)?|give\s+me\s+)?(?:some\s+)?"
+    r"(?:more|other|different)\s+(?!(?:recipes?|options|dishes|meals|ideas|ones|choices|like|of|than|please)\b)"
+    r"(?P<query>[a-z][a-z '-]*?)"
+    r"(?:\s+(?:recipes?|options|dishes|meals|ideas|ones|choices))?\s*(?:,?\s*please)?\s*[.!?]*\s*",
+    re.IGNORECASE
+)
+
+# Responses to deterministic completions, shared by all agents in the process
+# and evicted least-recently-used first
+_response_cache: "OrderedDict[str, ChatCompletion]" = OrderedDict()
+
+# OpenAI client shared by all agents, created on first use, and the httpx
+# client that holds its connection pool
+_client: Optional[AsyncOpenAI] = None
+_http_client: Optional[httpx.AsyncClient] = None
+
+# Bounds in-flight completions across every agent in the process; a streamed
+# completion keeps its slot until the stream has been read
+_openai_semaphore = asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENCY)
+
+def get_openai_client() -> AsyncOpenAI:
+    """Return the process-wide OpenAI client, creating it if needed."""
+    global _client, _http_client
+    if _client is None:
+        # Create custom httpx client without proxy settings, with a pool large
+        # enough that concurrent agents reuse connections instead of queueing.
+        # HTTP/2 multiplexes concurrent completions over the same connections
+        _http_client = httpx.AsyncClient(
             base_url="https://api.openai.com/v1",
-            timeout=httpx.Timeout(60.0),
+            http2=True,
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=30.0),
             follow_redirects=True
         )
         
         # Initialize OpenAI client with custom http client
-        self.client = AsyncOpenAI(
-            http_client=http_client,
+        _client = AsyncOpenAI(
+            http_client=_http_client,
             api_key=settings.OPENAI_API_KEY
         )
+    return _client
+
+async def close_openai_client():
+    """Close the shared OpenAI client and its connection pool."""
+    global _client, _http_client
+    if _client is not None:
+        try:
+            await _client.close()
+        finally:
+            # Closing an already closed httpx client is a no-op
+            await _http_client.aclose()
+            _client = _http_client = None
+
+def remember_response(cache_key: str, response: ChatCompletion):
+    """Add a response to the in-process cache, evicting the oldest if full."""
+    _response_cache[cache_key] = response
+    if len(_response_cache) > settings.OPENAI_CACHE_SIZE:
+        _response_cache.popitem(last=False)
+
+def recent_history(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Bound the conversation sent to OpenAI to its opening and latest turns.
+    
+    The system prompt and greeting are always kept, so the cached prompt prefix
+    stays intact, along with the summary of older turns if there is one,
+    followed by at most OPENAI_MAX_HISTORY_MESSAGES recent messages.
+    """
+    limit = settings.OPENAI_MAX_HISTORY_MESSAGES
+    # The summary comes right after the opening pair, and has to survive
+    # while a newer one is still being made or couldn't be
+    head = 2
+    if (len(messages) > 2 and messages[2]["role"] == "system"
+            and messages[2]["content"].startswith(SUMMARY_PREFIX)):
+        head = 3
+    if len(messages) <= head + limit:
+        return messages
+    start = len(messages) - limit
+    # A tool result can't be sent without the assistant message that called it
+    while messages[start]["role"] == "tool":
+        start -= 1
+    return messages[:head] + messages[start:]
+
+def parse_indices(text: str, count: int) -> Set[int]:
+    """Collect the recipe numbers between 1 and count mentioned in text.
+    
+    Walks the string once, without a regex or an intermediate list.
+    """
+    indices = set()
+    current = 0
+    in_number = False
+    for char in text:
+        if "0" <= char <= "9":
+            current = current * 10 + (ord(char) - 48)
+            in_number = True
+        elif in_number:
+            if 1 <= current <= count:
+                indices.add(current)
+            current = 0
+            in_number = False
+    if in_number and 1 <= current <= count:
+        indices.add(current)
+    return indices
+
+@lru_cache(maxsize=256)
+def format_recipe_details(
+    name: str,
+    url: str,
+    servings: int,
+    scaled_servings: Optional[int],
+    total_time: Optional[int],
+    calories: Optional[float],
+    cuisine_type: Tuple[str, ...],
+    diet_labels: Tuple[str, ...],
+    health_labels: Tuple[str, ...]
+) -> str:
+    """Format recipe details as a string.
+    
+    Takes the recipe's fields rather than the Recipe itself so the result can
+    be cached; the same recipe and servings always format the same way.
+    """
+    details = []
+    details.append(f"  • {name}")
+    
+    if scaled_servings:
+        details.append(f"    Servings: {scaled_servings} (scaled from original {servings})")
+    else:
+        details.append(f"    Servings: {servings}")
+    
+    if total_time:
+        details.append(f"    Time: {total_time} minutes")
+    
+    if cuisine_type:
+        details.append(f"    Cuisine: {', '.join(cuisine_type)}")
+    
+    if diet_labels:
+        details.append(f"    Diet Labels: {', '.join(diet_labels)}")
+    if health_labels:
+        details.append(f"    Health Labels: {', '.join(health_labels)}")
+    
+    if calories:
+        calories_per_serving = calories / servings
+        if scaled_servings:
+            details.append(f"    Calories per serving: {int(calories_per_serving)} kcal (total: {int(calories_per_serving * scaled_servings)} kcal)")
+        else:
+            details.append(f"    Calories per serving: {int(calories_per_serving)} kcal")
+    
+    details.append(f"    Recipe Link: {url}")
+    return "\n".join(details) + "\n"
+
+class MealPlannerAgent:
+    """Main agent class for meal planning."""
+    
+    # All state is assigned in __init__, so instances don't need a __dict__.
+    # __weakref__ lets app.py track live agents in a WeakValueDictionary.
+    __slots__ = (
+        "recipe_api", "shopping_list", "user_preferences", "client",
+        "websocket", "user_input_queue", "_running",
+        "_prefetch_tasks", "session_id", "__weakref__"
+    )
+    
+    def __init__(self, client: Optional[AsyncOpenAI] = None, session_id: Optional[str] = None):
+        # Share the recipe API session and its rate limit across agents too
+        self.recipe_api = get_recipe_api()
+        self.shopping_list = ShoppingList()
+        self.user_preferences = None
+        
+        # Share one OpenAI client (and its connection pool) across agents
+        # unless the caller injects its own
+        self.client = client or get_openai_client()
+        
+        # Stable per-session id sent as the OpenAI user, so a conversation's
+        # requests are routed together and reuse the cached prompt prefix
+        self.session_id = session_id or uuid.uuid4().hex
         
         self.websocket = None
-        self.user_input_queue = asyncio.Queue()
+        # Bounded so a client flooding the socket can't grow it without limit
+        self.user_input_queue = asyncio.Queue(maxsize=settings.USER_INPUT_QUEUE_SIZE)
         self._running = True
         
+        # Speculative searches for cuisines mentioned during the conversation
+        self._prefetch_tasks: Dict[str, asyncio.Task] = {}
+        
     async def __aenter__(self):
         return self
         
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self.client.close()
-        if hasattr(self.client, 'http_client'):
-            await self.client.http_client.aclose()
+        # The OpenAI client is shared, it is closed on application shutdown
+        pass
         
     async def send_message(self, message: str, message_type: str = "assistant"):
-        """Send a message to the client."""
-        if self.websocket and self._running:
+        """Send a message to the client, or print it when running from the command line."""
+        if self.websocket is None:
+            # One write per message, so a multi-line message is flushed once
+            if message_type == "assistant_delta":
+                sys.stdout.write(message)
+                sys.stdout.flush()
+            else:
+                sys.stdout.write(f"{message}\n")
+        elif self._running:
             try:
-                await self.websocket.send_json({
+                # Serialized here so every streamed delta goes through orjson
+                await self.websocket.send_text(json_dumps({
                     "type": message_type,
                     "content": message
-                })
+                }))
             except Exception as e:
                 self._running = False
                 raise
     
+    @contextlib.asynccontextmanager
+    async def _chat_stream(self, **kwargs):
+        """Open a streamed chat completion, holding a request slot until it's read."""
+        async with _openai_semaphore:
+            stream = await self._chat(**kwargs, stream=True, _slot_held=True)
+            try:
+                yield stream
+            finally:
+                await stream.close()
+    
+    async def _chat(self, _slot_held: bool = False, cache: bool = True, **kwargs):
+        """Create a chat completion, retrying with exponential backoff on rate limits.
+        
+        Deterministic (temperature=0) completions are served from an in-process
+        LRU cache keyed by a hash of the whole request (model, messages,
+        temperature, response_format, ...), backed by an on-disk cache that
+        survives restarts. Pass cache=False for requests that can never repeat.
+        _slot_held is set by _chat_stream, which already holds a request slot
+        for the life of the stream.
+        """
+        cache_key = None
+        if cache and kwargs.get("temperature") == 0 and not kwargs.get("stream"):
+            cache_key = hashlib.sha256(canonical_json(kwargs)).hexdigest()
+            if cache_key in _response_cache:
+                _response_cache.move_to_end(cache_key)
+                return _response_cache[cache_key]
+            cached = await asyncio.to_thread(llm_cache.get, cache_key)
+            if cached is not None:
+                response = ChatCompletion.model_validate_json(cached)
+                remember_response(cache_key, response)
+                return response
+        
+        delay = 1.0
+        for attempt in range(settings.OPENAI_MAX_RETRIES):
+            try:
+                async with contextlib.nullcontext() if _slot_held else _openai_semaphore:
+                    # The user id is left out of the cache key above so identical
+                    # requests from different sessions still share entries
+                    response = await self.client.chat.completions.create(**kwargs, user=self.session_id)
+                break
+            except RateLimitError:
+                if attempt == settings.OPENAI_MAX_RETRIES - 1:
+                    raise
+                # Full jitter keeps concurrent agents from retrying in lockstep
+                backoff = random.uniform(0, delay)
+                logger.warning(f"OpenAI rate limit hit, retrying in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+                delay = min(delay * 2, 60.0)
+        
+        if cache_key:
+            remember_response(cache_key, response)
+            await asyncio.to_thread(llm_cache.set, cache_key, response.model_dump_json())
+        return response
+    
     async def get_user_input(self, prompt: str = None) -> str:
-        """Get input from the user through websocket."""
+        """Get input from the user through websocket, or stdin from the command line."""
         if prompt:
             await self.send_message(prompt)
         
         if not self._running:
             raise asyncio.CancelledError("Agent is no longer running")
+        
+        if self.websocket is None:
+            # Read stdin in a worker thread so the event loop keeps running
+            return await asyncio.to_thread(input, "\nYou: ")
             
         try:
             return await self.user_input_queue.get()
@@ -74,20 +441,38 @@ class MealPlannerAgent:
             self._running = False
             raise
     
+    def submit_user_input(self, content: str) -> bool:
+        """Queue input from the websocket client, dropping the oldest when full.
+        
+        Returns False if an older message had to be dropped.
+        """
+        try:
+            self.user_input_queue.put_nowait(content)
+            return True
+        except asyncio.QueueFull:
+            self.user_input_queue.get_nowait()
+            self.user_input_queue.put_nowait(content)
+            return False
+    
     async def run(self):
         """Main execution flow for the meal planning agent."""
+        prewarm_task = None
         try:
             # Validate environment
             settings.validate_settings()
             logger.info("Environment settings validated")
             
+            # Connect to the recipe API while the user is still chatting. The
+            # search doesn't wait for it, a slow handshake only costs itself
+            prewarm_task = asyncio.create_task(self.recipe_api.prewarm())
+            
             # Step 1: Collect user preferences
             logger.info("Starting user preferences collection")
             self.user_preferences = await self._collect_user_preferences()
             logger.info(f"Collected user preferences: {self.user_preferences}")
             
-            # Step 2: Search for recipes
-            await self.send_message("Searching for recipes that match your preferences...")
+            # Step 2: Search for recipes, the user was already told about it
+            # when the preferences were submitted
             logger.info("Starting recipe search")
             recipes = await self._search_recipes()
             logger.info(f"Found {len(recipes)} matching recipes")
@@ -101,211 +486,257 @@ class MealPlannerAgent:
             # Step 4: Generate shopping list
             await self.send_message("Generating your shopping list...")
             logger.info("Generating shopping list")
-            shopping_list = await self._generate_shopping_list(selected_recipes)
+            shopping_list, multipliers = await self._generate_shopping_list(selected_recipes)
             logger.info("Shopping list generated")
             
             # Present results to user
             logger.info("Presenting final results")
-            await self._present_results(selected_recipes, shopping_list)
+            await self._present_results(selected_recipes, shopping_list, multipliers)
             
         except Exception as e:
             logger.error(f"Error in meal planning session: {str(e)}", exc_info=True)
             await self.send_message(f"An error occurred: {str(e)}", "error")
             raise
+        finally:
+            if prewarm_task is not None:
+                prewarm_task.cancel()
+            self._cancel_prefetch()
     
     async def _collect_user_preferences(self) -> UserPreferences:
         """Collect and validate user preferences through natural conversation."""
-        messages = [
-            {"role": "system", "content": """You are a helpful meal planning assistant. 
-             Your task is to collect the following information in a friendly, conversational way:
-             1. Number of meals they need for the week
-             2. Cuisine preferences (Italian, Mexican, Asian, etc.)
-             3. Any dietary restrictions (vegetarian, vegan, gluten-free, etc.)
-             4. Days they're available to cook
-             5. Number of servings per meal
-             
-             Start by welcoming them and asking about the number of meals.
-             Be friendly and conversational while efficiently collecting information.
-             After collecting all information, summarize it and ask for confirmation.
-             When the user confirms, respond ONLY with: "Great! Let me search for recipes that match your preferences..."
-             """},
-            {"role": "assistant", "content": "Hi! I'm here to help you plan your meals for the week. Let's start with how many meals you'd like to prepare. How many dinners would you like to plan?"}
-        ]
+        messages = list(COLLECT_OPENING_MESSAGES)
         
         # Initialize preferences with default values
         preferences = None
+        # Summary of older turns, run in the background one at a time
+        compaction: Optional[asyncio.Task] = None
         
         # Send the first message
         await self.send_message(messages[1]["content"])
         
-        while preferences is None:
-            # Get user's response
-            user_response = await self.get_user_input()
-            
-            # Add user's response to messages
-            messages.append({"role": "user", "content": user_response})
-            
-            # Get next message from OpenAI
-            response = await self.client.chat.completions.create(
-                model=settings.MODEL_NAME,
-                messages=messages,
-                temperature=0.7
-            )
-            
-            # Send assistant's message
-            assistant_message = response.choices[0].message.content
-            await self.send_message(assistant_message)
-            
-            # If this is the transition message, extract preferences
-            if "search for recipes" in assistant_message.lower():
-                # Extract final preferences
-                extraction_messages = [
-                    {"role": "system", "content": """You are a JSON extraction expert. Extract the meal planning preferences from the conversation and format them EXACTLY as shown:
-                     {
-                         "meal_count": <integer>,
-                         "dietary_restrictions": [<string>, ...],
-                         "cuisine_preferences": [<string>, ...],
-                         "cooking_days": [<string>, ...],
-                         "servings_per_meal": <integer>
-                     }
-                     
-                     Rules:
-                     1. meal_count and servings_per_meal must be integers
-                     2. All arrays must be properly formatted, even if empty
-                     3. If no dietary restrictions, use empty array []
-                     4. Convert "none" or "no restrictions" to empty array
-                     5. Ensure all strings are properly quoted
-                     6. Use exact field names as shown"""},
-                    {"role": "user", "content": str(messages[:-2])}  # Exclude the last confirmation exchange
-                ]
+        try:
+            while preferences is None:
+                # Get user's response
+                user_response = await self.get_user_input()
                 
-                try:
-                    extraction_response = await self.client.chat.completions.create(
-                        model=settings.MODEL_NAME,
-                        messages=extraction_messages,
-                        temperature=0
-                    )
-                    
-                    extracted_text = extraction_response.choices[0].message.content.strip()
-                    
-                    # Find the JSON object in the response
-                    start_idx = extracted_text.find('{')
-                    end_idx = extracted_text.rfind('}') + 1
-                    if start_idx >= 0 and end_idx > start_idx:
-                        json_str = extracted_text[start_idx:end_idx]
-                        preferences = json.loads(json_str)
-                        
-                        # Convert "none" to empty array for dietary restrictions
-                        if isinstance(preferences["dietary_restrictions"], str):
-                            if preferences["dietary_restrictions"].lower() in ["none", "no restrictions"]:
-                                preferences["dietary_restrictions"] = []
+                # Add user's response to messages
+                messages.append({"role": "user", "content": user_response})
+                self._prefetch_cuisines(user_response)
+                
+                # Stream the next message from OpenAI to the user
+                assistant_message, tool_call = await self._stream_reply(messages)
+                
+                # If the assistant submitted the confirmed preferences, we're done
+                if tool_call is not None:
+                    call_id, arguments = tool_call
+                    error = None
+                    try:
+                        # Parse and validate the function arguments in a single pass
+                        preferences = UserPreferences.model_validate_json(arguments)
                         
                         # Validate the extracted preferences
-                        if not self._is_preferences_complete(preferences):
-                            await self.send_message("\nI apologize, but I couldn't properly capture all your preferences. Let's try again.")
-                            preferences = None
-                    else:
-                        await self.send_message("\nI apologize, but I couldn't properly extract your preferences. Let's try again.")
-                        preferences = None
-                except json.JSONDecodeError as e:
-                    await self.send_message(f"\nError parsing preferences: {str(e)}")
-                    preferences = None
-                except Exception as e:
-                    await self.send_message(f"\nUnexpected error while extracting preferences: {str(e)}")
+                        if not validate_preferences(preferences):
+                            error = "meal_count, servings_per_meal and cooking_days must all be set"
+                    except ValidationError as e:
+                        error = str(e)
+                    
+                    if error is None:
+                        await self.send_message("Great! Let me search for recipes that match your preferences...")
+                        break
+                    
+                    # Return the problem as the function result, so the assistant
+                    # can ask the user about it with the conversation intact
                     preferences = None
-                break  # Exit the loop if we got the transition message
-            
-            # Add assistant's message to conversation
-            messages.append({"role": "assistant", "content": assistant_message})
+                    messages.append({
+                        "role": "assistant",
+                        "content": assistant_message or None,
+                        "tool_calls": [{
+                            "id": call_id,
+                            "type": "function",
+                            "function": {"name": PREFERENCES_TOOL["function"]["name"], "arguments": arguments}
+                        }]
+                    })
+                    messages.append({"role": "tool", "tool_call_id": call_id, "content": f"Invalid preferences: {error}"})
+                    assistant_message, _ = await self._stream_reply(messages, tool_choice="none")
+                
+                # Add assistant's message to conversation
+                messages.append({"role": "assistant", "content": assistant_message})
+                
+                # Summarize older turns while the user writes their next reply,
+                # instead of delaying the next streamed answer
+                if compaction is None or compaction.done():
+                    compaction = asyncio.create_task(self._compact_history(messages))
+        finally:
+            if compaction is not None:
+                compaction.cancel()
         
         if preferences is None:
             raise ValueError("Failed to collect valid preferences")
             
-        # Create and return UserPreferences object
-        return UserPreferences(
-            meal_count=preferences["meal_count"],
-            dietary_restrictions=preferences["dietary_restrictions"],
-            cuisine_preferences=preferences["cuisine_preferences"],
-            cooking_days=preferences["cooking_days"],
-            servings_per_meal=preferences["servings_per_meal"]
-        )
-    
-    def _is_preferences_complete(self, preferences: Dict[str, Any]) -> bool:
-        """Check if all required preferences have been collected."""
-        return (
-            preferences["meal_count"] > 0
-            and len(preferences["cooking_days"]) > 0
-            and preferences["servings_per_meal"] > 0
-        )
+        return preferences
     
-    async def _extract_preferences(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
-        """Extract preferences from conversation history."""
-        # Ask OpenAI to extract preferences from the conversation
-        extraction_messages = [
-            {"role": "system", "content": """Extract meal planning preferences from the conversation.
-             Return a JSON object with the following fields:
-             {
-                 "meal_count": int,
-                 "dietary_restrictions": list of strings,
-                 "cuisine_preferences": list of strings,
-                 "cooking_days": list of strings,
-                 "servings_per_meal": int
-             }
-             If a field cannot be determined, use the default values (0 for numbers, empty list for lists)."""},
-            {"role": "user", "content": f"Extract preferences from this conversation:\n{str(messages)}"}
-        ]
-        
-        response = await self.client.chat.completions.create(
-            model=settings.MODEL_NAME,
-            messages=extraction_messages,
-            temperature=0
-        )
+    async def _compact_history(self, messages: List[Dict[str, Any]]):
+        """Fold older turns into a summary once the conversation outgrows the window.
+        
+        recent_history() would otherwise drop them, and with them any
+        preferences the user stated early on. The opening messages stay first
+        so the cached prompt prefix is kept.
+        """
+        limit = settings.OPENAI_MAX_HISTORY_MESSAGES
+        if len(messages) <= 2 + limit:
+            return
+        start = len(messages) - limit // 2
+        # A tool result can't be kept without the assistant message that called it
+        while messages[start]["role"] == "tool":
+            start -= 1
         
-        # Parse the response as JSON
         try:
-            preferences = json.loads(response.choices[0].message.content)
-            return preferences
-        except json.JSONDecodeError:
-            return {
-                "meal_count": 0,
-                "dietary_restrictions": [],
-                "cuisine_preferences": [],
-                "cooking_days": [],
-                "servings_per_meal": 1
-            }
+            response = await self._chat(
+                model=settings.EXTRACTION_MODEL_NAME,
+                messages=[SUMMARY_SYSTEM_MESSAGE, {"role": "user", "content": json_dumps(messages[2:start])}],
+                temperature=0,
+                max_tokens=200,
+                seed=settings.OPENAI_SEED,
+                # Every summary is of a different conversation, so a cached
+                # copy would never be hit and would only keep it on disk
+                cache=False
+            )
+        except Exception as e:
+            # recent_history() still keeps the request bounded
+            logger.warning(f"Could not summarize conversation history: {e}")
+            return
+        
+        summary = response.choices[0].message.content
+        # An earlier summary is part of messages[2:start], so this one covers it
+        messages[2:start] = [{"role": "system", "content": f"{SUMMARY_PREFIX}{summary}"}]
+    
+    async def _stream_reply(self, messages: List[Dict[str, Any]], **kwargs) -> Tuple[str, Optional[Tuple[str, str]]]:
+        """Stream the assistant's next turn to the user as it is generated.
+        
+        Returns the full message text and, if the assistant called
+        submit_preferences, the call id and raw function arguments. The user
+        is told the preferences are being checked as soon as the call starts.
+        """
+        content_parts = []
+        call_id = None
+        argument_parts = None
+        async with self._chat_stream(
+            model=settings.MODEL_NAME,
+            messages=recent_history(messages),
+            tools=[PREFERENCES_TOOL],
+            parallel_tool_calls=False,
+            temperature=0.7,
+            max_tokens=settings.OPENAI_MAX_REPLY_TOKENS,
+            **kwargs
+        ) as stream:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content_parts.append(delta.content)
+                    await self.send_message(delta.content, "assistant_delta")
+                for tool_call in delta.tool_calls or []:
+                    # Only the first tool call is used, its arguments arrive in pieces
+                    if tool_call.index != 0:
+                        continue
+                    if argument_parts is None:
+                        argument_parts = []
+                        # Tell the user right away instead of after the arguments
+                        # have finished generating
+                        if content_parts:
+                            await self.send_message("", "assistant_done")
+                        await self.send_message("Checking your preferences...")
+                    if tool_call.id:
+                        call_id = tool_call.id
+                    if tool_call.function and tool_call.function.arguments:
+                        argument_parts.append(tool_call.function.arguments)
+        
+        # Mark the end of the streamed message, which also ends the line on
+        # the terminal before anything else is printed
+        if content_parts and argument_parts is None:
+            await self.send_message("", "assistant_done")
+        
+        if argument_parts is None:
+            return "".join(content_parts), None
+        return "".join(content_parts), (call_id, "".join(argument_parts))
     
     async def _search_recipes(self) -> List[Recipe]:
         """Search for recipes based on user preferences."""
-        all_recipes = []
+        cuisines = self.user_preferences.cuisine_preferences
+        diet = self.user_preferences.dietary_restrictions
         
         # If no cuisine preferences, do a single search with default query
-        if not self.user_preferences.cuisine_preferences:
-            return self.recipe_api.search_recipes(
+        if not cuisines:
+            return await self.recipe_api.search_recipes_async(
                 query="healthy",  # Default query if no cuisine preferences
-                diet=self.user_preferences.dietary_restrictions,
+                diet=diet,
                 meal_type=["lunch/dinner"],
                 dish_type=["main course"]
             )
         
-        # Search for each cuisine type separately
-        for cuisine in self.user_preferences.cuisine_preferences:
-            await self.send_message(f"\nSearching for {cuisine} recipes...")
-            cuisine_recipes = self.recipe_api.search_recipes(
-                query=cuisine,  # Use cuisine type as the query
-                diet=self.user_preferences.dietary_restrictions,
-                cuisine_type=[cuisine],  # Search for this specific cuisine
-                meal_type=["lunch/dinner"],
-                dish_type=["main course"],
-                max_results=5  # Limit results per cuisine to ensure variety
-            )
-            all_recipes.extend(cuisine_recipes)
-        
-        # Shuffle the combined results to mix cuisines
-        import random
-        random.shuffle(all_recipes)
+        # Search for each cuisine type separately, all at once. Prefetched
+        # searches ran without a diet filter, so they only count without one
+        prefetched = self._prefetch_tasks if not diet else {}
+        searches = [
+            prefetched.pop(cuisine.lower(), None) or self._search_cuisine(cuisine, diet)
+            for cuisine in cuisines
+        ]
+        self._cancel_prefetch()
         
-        # Return the combined results, limited to a reasonable number
-        return all_recipes[:10]  # Limit total results to 10 recipes
+        # Start the searches before the status messages so they overlap
+        gathered = asyncio.gather(*searches, return_exceptions=True)
+        try:
+            for cuisine in cuisines:
+                await self.send_message(f"\nSearching for {cuisine} recipes...")
+        except BaseException:
+            gathered.cancel()
+            raise
+        results = await gathered
+        
+        # Keep whatever cuisines succeeded, only fail if all of them did
+        if all(isinstance(result, BaseException) for result in results):
+            raise results[0]
+        for cuisine, result in zip(cuisines, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"Recipe search for {cuisine} failed: {result!r}")
+        # A recipe can match more than one cuisine, keep only its first hit
+        unique_recipes: Dict[str, Recipe] = {}
+        for recipe in chain.from_iterable(
+            result for result in results if not isinstance(result, BaseException)
+        ):
+            unique_recipes.setdefault(recipe.url, recipe)
+        all_recipes = list(unique_recipes.values())
+        
+        # Return a random mix of the cuisines, limited to 10 recipes
+        return random.sample(all_recipes, min(10, len(all_recipes)))
+    
+    def _search_cuisine(self, cuisine: str, diet: List[str]):
+        """Return the search coroutine for a single cuisine."""
+        return self.recipe_api.search_recipes_async(
+            query=cuisine,  # Use cuisine type as the query
+            diet=diet,
+            cuisine_type=[cuisine],  # Search for this specific cuisine
+            meal_type=["lunch/dinner"],
+            dish_type=["main course"],
+            max_results=5  # Limit results per cuisine to ensure variety
+        )
+    
+    def _prefetch_cuisines(self, text: str):
+        """Start searching for any new cuisines mentioned in text."""
+        for match in CUISINE_PATTERN.finditer(text):
+            cuisine = match.group(1).lower()
+            if cuisine not in self._prefetch_tasks:
+                task = asyncio.create_task(self._search_cuisine(cuisine, []))
+                # Unused searches may fail unobserved, mark their errors as seen
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                self._prefetch_tasks[cuisine] = task
+    
+    def _cancel_prefetch(self):
+        """Cancel speculative searches that weren't used."""
+        for task in self._prefetch_tasks.values():
+            task.cancel()
+        self._prefetch_tasks.clear()
     
     async def _get_recipe_selections(self, recipes: List[Recipe]) -> List[Recipe]:
         """Present recipes to user and get their selections."""
@@ -314,27 +745,39 @@ class MealPlannerAgent:
             return []
 
         # Calculate how many recipes we need based on cooking days
-        needed_recipes = len(self.user_preferences.cooking_days)
+        cooking_days = self.user_preferences.cooking_days
+        diet = self.user_preferences.dietary_restrictions
+        needed_recipes = len(cooking_days)
         
         # Keep track of all recipes shown
-        all_recipes = recipes.copy()
+        seen_urls = {recipe.url for recipe in recipes}
         current_recipes = recipes
-        
-        async def display_current_recipes():
-            recipe_display = "\nAvailable recipes:\n"
+        # The page as the selection interpreter sees it, built with the display
+        # so it isn't rebuilt for every reply the model has to interpret
+        recipe_context = ""
+        
+        async def display_current_recipes(prompt: str):
+            nonlocal recipe_context
+            # The list and the prompt that follows it go out as one message
+            lines = ["\nAvailable recipes:"]
+            context_lines = ["Available recipes:"]
+            servings_info = f"(Can be adjusted to {self.user_preferences.servings_per_meal} servings)"
             for i, recipe in enumerate(current_recipes, 1):
-                servings_info = f"(Can be adjusted to {self.user_preferences.servings_per_meal} servings)"
-                cooking_time = f", {recipe.total_time} minutes" if recipe.total_time else ""
-                recipe_display += f"\n{i}. {recipe.name} {servings_info}{cooking_time}"
-                recipe_display += f"\n   Cuisine: {', '.join(recipe.cuisine_type) if recipe.cuisine_type else 'Not specified'}"
-                recipe_display += f"\n   Link: {recipe.url}\n"
-            await self.send_message(recipe_display)
+                total_time, cuisine_type = recipe.total_time, recipe.cuisine_type
+                cooking_time = f", {total_time} minutes" if total_time else ""
+                lines.append(f"\n{i}. {recipe.name} {servings_info}{cooking_time}")
+                lines.append(f"   Cuisine: {', '.join(cuisine_type) if cuisine_type else 'Not specified'}")
+                lines.append(f"   Link: {recipe.url}")
+                context_lines.append(f"{i}. {recipe.name}")
+            lines.append(f"\n{prompt}")
+            recipe_context = "\n".join(context_lines)
+            await self.send_message("\n".join(lines))
 
-        await display_current_recipes()
-        selected_indices = set()
+        # Recipes picked so far by URL, kept across turns and "more recipes" pages
+        selected: Dict[str, Recipe] = {}
         
-        # Send initial selection prompt
-        selection_prompt = f"""I see you need {needed_recipes} recipes for your cooking days: {', '.join(self.user_preferences.cooking_days)}.
+        # Send the recipes with the initial selection prompt
+        selection_prompt = f"""I see you need {needed_recipes} recipes for your cooking days: {', '.join(cooking_days)}.
         
 You can:
 - Select recipes by their numbers or names
@@ -346,85 +789,56 @@ For example:
 - "Show me more chicken recipes"
 
 Which {needed_recipes} recipes would you like?"""
-        await self.send_message(selection_prompt)
+        await display_current_recipes(selection_prompt)
         
-        while len(selected_indices) != needed_recipes:
+        while len(selected) != needed_recipes:
             # Get user's response
             user_response = await self.get_user_input()
             
             try:
-                # Create a context message with recipe information
-                recipe_context = "Available recipes:\n" + "\n".join(
-                    f"{i}. {recipe.name}" for i, recipe in enumerate(current_recipes, 1)
-                )
+                # Plain recipe numbers ("2 and 4") and simple requests for more
+                # recipes are parsed locally; anything else needs the model
+                valid_indices = set()
+                search_term = None
                 
-                # Ask OpenAI to parse the response
-                extraction_messages = [
-                    {"role": "system", "content": f"""Determine if the user is selecting recipes or requesting more recipes.
-                     {recipe_context}
-                     
-                     If selecting recipes:
-                     Return ONLY a JSON array of integers representing the selected recipe indices.
-                     
-                     If requesting more recipes:
-                     Return ONLY "MORE_RECIPES: <search_term>"
-                     
-                     If unclear:
-                     Return "[]"
-                     
-                     Examples:
-                     [1, 3]
-                     "MORE_RECIPES: chicken"
-                     []"""},
-                    {"role": "user", "content": user_response}
-                ]
-                
-                response = await self.client.chat.completions.create(
-                    model=settings.MODEL_NAME,
-                    messages=extraction_messages,
-                    temperature=0
-                )
-                
-                result = response.choices[0].message.content.strip()
+                more_match = MORE_RECIPES_PATTERN.fullmatch(user_response)
+                if more_match:
+                    search_term = more_match.group("query")
+                elif NUMBERED_SELECTION_PATTERN.fullmatch(user_response):
+                    valid_indices = parse_indices(user_response, len(current_recipes))
+                # Only replies with words in them (recipe names, "something
+                # lighter") need the model, bare out-of-range numbers don't
+                elif any(char.isalpha() for char in user_response):
+                    selection = await self._interpret_selection(user_response, recipe_context)
+                    if selection.more_recipes_query:
+                        search_term = selection.more_recipes_query.strip()
+                    else:
+                        valid_indices = {i for i in selection.selected_indices if 1 <= i <= len(current_recipes)}
                 
                 # Check if user is requesting more recipes
-                if result.startswith("MORE_RECIPES:"):
-                    search_term = result.split(":", 1)[1].strip()
+                if search_term:
                     await self.send_message(f"\nSearching for more recipes with '{search_term}'...")
                     
                     # Search for additional recipes
-                    new_recipes = self.recipe_api.search_recipes(
+                    new_recipes = await self.recipe_api.search_recipes_async(
                         query=search_term,
-                        diet=self.user_preferences.dietary_restrictions,
+                        diet=diet,
                         meal_type=["lunch/dinner"],
                         dish_type=["main course"]
                     )
                     
                     # Filter out recipes we've already shown
-                    seen_urls = {recipe.url for recipe in all_recipes}
                     new_recipes = [r for r in new_recipes if r.url not in seen_urls]
                     
                     if new_recipes:
                         # Update recipe lists
                         current_recipes = new_recipes
-                        all_recipes.extend(new_recipes)
-                        await display_current_recipes()
-                        
-                        await self.send_message("Here are some additional recipes. Which would you like to select?")
+                        seen_urls.update(r.url for r in new_recipes)
+                        await display_current_recipes("Here are some additional recipes. Which would you like to select?")
                     else:
                         await self.send_message("I couldn't find any new recipes matching your criteria. Please select from the current options or try a different search.")
                     continue
                 
-                # Handle recipe selection
-                import json
-                if result.startswith("["):
-                    new_indices = set(json.loads(result))
-                else:
-                    new_indices = set()
-                
-                # Validate indices
-                valid_indices = {i for i in new_indices if 1 <= i <= len(current_recipes)}
-                
                 if not valid_indices:
                     await self.send_message(f"""I'm not sure which recipes you want. You can:
                      - Select recipes by number or name
@@ -433,24 +847,33 @@ Which {needed_recipes} recipes would you like?"""
                      Please select {needed_recipes} recipes or ask for more options.""")
                     continue
                 
-                # Update selected indices
-                selected_indices = valid_indices
+                # A full selection replaces earlier picks, a partial one adds to them
+                picks = [current_recipes[i-1] for i in sorted(valid_indices)]
+                chosen = {} if len(picks) >= needed_recipes else dict(selected)
+                for recipe in picks:
+                    chosen.setdefault(recipe.url, recipe)
+                
+                # Too many picks are turned away without losing earlier ones
+                if len(chosen) > needed_recipes:
+                    kept = f"So far you have: {', '.join(recipe.name for recipe in selected.values())}." if selected else ""
+                    await self.send_message(f"""I understood you want: {', '.join(recipe.name for recipe in chosen.values())}.
+                     However, you only need {needed_recipes} recipes.
+                     Please select exactly {needed_recipes} recipes. {kept}""")
+                    continue
+                selected = chosen
                 
                 # Check if we have the right number of recipes
-                if len(selected_indices) < needed_recipes:
-                    remaining = needed_recipes - len(selected_indices)
-                    await self.send_message(f"""I understood you want: {', '.join(current_recipes[i-1].name for i in selected_indices)}.
+                selected_names = [recipe.name for recipe in selected.values()]
+                if len(selected) < needed_recipes:
+                    remaining = needed_recipes - len(selected)
+                    await self.send_message(f"""I understood you want: {', '.join(selected_names)}.
                      You still need to select {remaining} more recipe(s).
                      You can:
                      - Select from the current recipes
                      - Ask to see more recipes with specific criteria""")
-                elif len(selected_indices) > needed_recipes:
-                    await self.send_message(f"""I understood you want: {', '.join(current_recipes[i-1].name for i in selected_indices)}.
-                     However, you only need {needed_recipes} recipes.
-                     Please select exactly {needed_recipes} recipes.""")
                 else:
                     await self.send_message(f"""Perfect! You've selected:
-                     {chr(10).join(f'- {current_recipes[i-1].name}' for i in selected_indices)}""")
+                     {chr(10).join(f'- {name}' for name in selected_names)}""")
                     
             except Exception as e:
                 await self.send_message(f"\nError parsing selection: {e}")
@@ -461,119 +884,110 @@ Which {needed_recipes} recipes would you like?"""
                      
                      Please select {needed_recipes} recipes or ask for more options.""")
 
-        # Return selected recipes from the current set
-        return [current_recipes[i-1] for i in selected_indices]
+        return list(selected.values())
     
-    async def _generate_shopping_list(self, recipes: List[Recipe]) -> List[Dict[str, str]]:
-        """Generate consolidated shopping list from selected recipes."""
-        self.shopping_list.clear()
+    async def _interpret_selection(self, user_response: str, recipe_context: str) -> RecipeSelection:
+        """Ask OpenAI whether the user is selecting recipes by name or requesting more.
+        
+        recipe_context is the numbered list of the recipes currently shown.
+        """
+        # Only the user slot varies between calls, so the system prompt stays
+        # a stable prefix for OpenAI's prompt caching
+        extraction_messages = [
+            SELECTION_SYSTEM_MESSAGE,
+            {"role": "user", "content": f"{recipe_context}\n\nUser reply: {user_response}"}
+        ]
         
-        # Calculate total servings needed for the week
-        total_servings_needed = len(self.user_preferences.cooking_days) * self.user_preferences.servings_per_meal
+        response = await self._chat(
+            model=settings.EXTRACTION_MODEL_NAME,
+            messages=extraction_messages,
+            response_format=SELECTION_RESPONSE_FORMAT,
+            temperature=0,
+            # The reply is a short JSON object, even ten picks fit in 100 tokens
+            max_tokens=100,
+            # Fixed seed so identical requests get the same answer
+            seed=settings.OPENAI_SEED
+        )
         
-        # Get optimal distribution of servings
-        multipliers = calculate_optimal_servings_distribution(recipes, total_servings_needed)
+        return RecipeSelection.model_validate_json(response.choices[0].message.content)
+    
+    async def _generate_shopping_list(self, recipes: List[Recipe]) -> Tuple[List[Dict[str, str]], List[float]]:
+        """Generate consolidated shopping list from selected recipes.
+        
+        Returns the list along with the servings multiplier used for each recipe.
+        """
+        self.shopping_list.clear()
+        
+        # Get optimal distribution of servings, each recipe cooks one meal
+        multipliers = calculate_optimal_servings_distribution(recipes, self.user_preferences.servings_per_meal)
         
         # Add each recipe with its optimal multiplier
-        for recipe, multiplier in zip(recipes, multipliers):
-            self.shopping_list.add_recipe(recipe, servings_multiplier=multiplier)
+        self.shopping_list.add_recipes(recipes, multipliers)
         
-        return self.shopping_list.get_consolidated_list()
+        return self.shopping_list.get_consolidated_list(), multipliers
     
-    async def _present_results(self, recipes: List[Recipe], shopping_list: List[Dict[str, str]]):
+    async def _present_results(self, recipes: List[Recipe], shopping_list: List[Dict[str, str]], multipliers: List[float]):
         """Present the final meal plan and shopping list to the user."""
-        # Calculate total servings needed and actual servings
-        total_servings_needed = len(self.user_preferences.cooking_days) * self.user_preferences.servings_per_meal
-        multipliers = calculate_optimal_servings_distribution(recipes, total_servings_needed)
+        preferences = self.user_preferences
         
         # Format meal plan
-        meal_plan = "\n=== Your Weekly Dinner Plan ===\n\n"
-        
-        # Map recipes to days
-        available_days = self.user_preferences.cooking_days
-        recipes_by_day = {}
+        meal_plan = ["\n=== Your Weekly Dinner Plan ===\n\n"]
         
+        # Format recipes by day, in order, then any days left without one
+        available_days = preferences.cooking_days
         for day, recipe, multiplier in zip(available_days, recipes, multipliers):
-            recipes_by_day[day] = (recipe, multiplier)
-        
-        # Format recipes by day
-        for day in available_days:
-            meal_plan += f"\n{day}:\n"
-            if day in recipes_by_day:
-                recipe, multiplier = recipes_by_day[day]
-                scaled_servings = int(recipe.servings * multiplier)
-                meal_plan += self._format_recipe_details(recipe, scaled_servings)
-            else:
-                meal_plan += "  • No recipe planned\n"
+            meal_plan.append(f"\n{day}:\n")
+            # Rounded, and at least one, so a scaled recipe is never shown as unscaled
+            meal_plan.append(self._format_recipe_details(recipe, max(1, round(recipe.servings * multiplier))))
+        for day in available_days[len(recipes):]:
+            meal_plan.append(f"\n{day}:\n  • No recipe planned\n")
         
-        await self.send_message(meal_plan)
+        await self.send_message("".join(meal_plan))
         
-        # Format and send shopping list
-        shopping_list_text = "\n=== Shopping List ===\n"
+        # Format and send shopping list as a single message
+        lines = ["\n=== Shopping List ==="]
         
-        # Group items by category
-        categorized_items = {}
+        # Group items by category; the consolidated list is already sorted by
+        # category, so insertion order is the display order
+        categorized_items = defaultdict(list)
         for item in shopping_list:
-            category = item.get("category", "Other")
-            if category not in categorized_items:
-                categorized_items[category] = []
-            categorized_items[category].append(item)
-        
-        # Format items by category
-        for category, items in sorted(categorized_items.items()):
-            shopping_list_text += f"\n{category}:\n"
-            for item in items:
-                quantity = item.get("quantity", "")
-                measure = item.get("measure", "")
-                food = item.get("food", "")
-                shopping_list_text += f"  • {quantity} {measure} {food}\n".strip() + "\n"
-        
-        await self.send_message(shopping_list_text)
+            categorized_items[item["category"]].append(item)
+        
+        # Format items by category, every item has all four keys
+        for category, items in categorized_items.items():
+            lines.append(f"\n{category}:")
+            lines.extend(f"  • {item['quantity']} {item['measure']} {item['food']}".strip() for item in items)
+        
+        await self.send_message("\n".join(lines) + "\n")
         
         # Send summary
-        summary = f"\nSummary:\n"
-        summary += f"• Planned dinners: {len(recipes)}\n"
-        summary += f"• Cooking days: {', '.join(available_days)}\n"
-        summary += f"• Servings per meal: {self.user_preferences.servings_per_meal}\n"
-        if self.user_preferences.dietary_restrictions:
-            summary += f"• Dietary restrictions: {', '.join(self.user_preferences.dietary_restrictions)}\n"
+        summary = [
+            "\nSummary:",
+            f"• Planned dinners: {len(recipes)}",
+            f"• Cooking days: {', '.join(available_days)}",
+            f"• Servings per meal: {preferences.servings_per_meal}"
+        ]
+        if preferences.dietary_restrictions:
+            summary.append(f"• Dietary restrictions: {', '.join(preferences.dietary_restrictions)}")
         
-        summary += "\nEnjoy your meals! 🍽️"
-        await self.send_message(summary)
+        summary.append("\nEnjoy your meals! 🍽️")
+        await self.send_message("\n".join(summary))
     
     def _format_recipe_details(self, recipe: Recipe, scaled_servings: Optional[int] = None) -> str:
         """Format recipe details as a string."""
-        details = []
-        details.append(f"  • {recipe.name}")
-        
-        if scaled_servings:
-            details.append(f"    Servings: {scaled_servings} (scaled from original {recipe.servings})")
-        else:
-            details.append(f"    Servings: {recipe.servings}")
-        
-        if recipe.total_time:
-            details.append(f"    Time: {recipe.total_time} minutes")
-        
-        if recipe.cuisine_type:
-            details.append(f"    Cuisine: {', '.join(recipe.cuisine_type)}")
-        
-        if recipe.diet_labels:
-            details.append(f"    Diet Labels: {', '.join(recipe.diet_labels)}")
-        if recipe.health_labels:
-            details.append(f"    Health Labels: {', '.join(recipe.health_labels[:3])}")
-        
-        if recipe.calories:
-            calories_per_serving = recipe.calories / recipe.servings
-            if scaled_servings:
-                details.append(f"    Calories per serving: {int(calories_per_serving)} kcal (total: {int(calories_per_serving * scaled_servings)} kcal)")
-            else:
-                details.append(f"    Calories per serving: {int(calories_per_serving)} kcal")
-        
-        details.append(f"    Recipe Link: {recipe.url}")
-        return "\n".join(details) + "\n"
+        return format_recipe_details(
+            recipe.name, recipe.url, recipe.servings, scaled_servings,
+            recipe.total_time, recipe.calories, tuple(recipe.cuisine_type),
+            tuple(recipe.diet_labels), tuple(recipe.health_labels[:3])
+        )
 
 if __name__ == "__main__":
-    import asyncio
+    async def main():
+        try:
+            await MealPlannerAgent().run()
+        finally:
+            await close_openai_client()
+            await close_recipe_api()
+            llm_cache.close()
     
-    agent = MealPlannerAgent()
-    asyncio.run(agent.run()) 
\ No newline at end of file
+    asyncio.run(main()) 
\ No newline at end of file
@@ -1,13 +1,17 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
-import json
-from agent import MealPlannerAgent
-from typing import Dict, List
+import contextlib
+import hashlib
+from agent import MealPlannerAgent, close_openai_client, json_dumps, json_loads
+from config import settings
+from tools import llm_cache
+from tools.recipe import close_recipe_api
 import logging
 import os
+import weakref
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,50 +25,78 @@ IS_DEVELOPMENT = os.environ.get('ENVIRONMENT', 'development') == 'development'
 # Configure CORS
 if IS_DEVELOPMENT:
     # In development, allow localhost:3000 and other local ports
-    origins = [
+    origins = (
         "http://localhost",
         "http://localhost:8000",
         "http://127.0.0.1:8000",
         "http://localhost:3000",
         "http://127.0.0.1:3000",
-    ]
+    )
 else:
-    # In production, allow the deployed domain and its secure variant
-    origins = [
-        "https://" + os.environ.get('RAILWAY_STATIC_URL', '*'),
-        "http://" + os.environ.get('RAILWAY_STATIC_URL', '*'),
-        "*"  # Fallback to allow all origins if needed
-    ]
+    # In production, allow the deployed domain and its secure variant. With
+    # credentials allowed a wildcard would accept any site, so without a
+    # configured domain only same-origin requests are served.
+    DOMAIN = os.environ.get('RAILWAY_STATIC_URL')
+    origins = (f"https://{DOMAIN}", f"http://{DOMAIN}") if DOMAIN else ()
 
+# The app only serves pages and static files, so preflights are answered
+# from fixed lists rather than echoing whatever the browser asks for
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=("GET", "POST", "OPTIONS"),
+    allow_headers=("content-type", "authorization"),
 )
 
-# Store active websocket connections and their agents
-connections: Dict[str, WebSocket] = {}
-agents: Dict[str, MealPlannerAgent] = {}
+# Store active websocket connections and their agents. These are per worker
+# process, which is fine since a session lives entirely on its one websocket.
+# Entries are weak, so a missed cleanup can't keep a finished session alive.
+connections: "weakref.WeakValueDictionary[str, WebSocket]" = weakref.WeakValueDictionary()
+agents: "weakref.WeakValueDictionary[str, MealPlannerAgent]" = weakref.WeakValueDictionary()
+
+# Caps the agents this worker runs at once; further clients are turned away
+agent_slots = asyncio.Semaphore(settings.MAX_AGENTS)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+@app.on_event("shutdown")
+async def shutdown():
+    """Close the clients and caches shared by all agents."""
+    await close_openai_client()
+    await close_recipe_api()
+    llm_cache.close()
+
+# The page only changes between deploys, so outside development it is read
+# once and served from memory
+with open("static/index.html", "rb") as f:
+    INDEX_HTML = f.read()
+INDEX_ETAG = f'"{hashlib.md5(INDEX_HTML, usedforsecurity=False).hexdigest()}"'
+
 @app.get("/")
-async def get_root():
+async def get_root(request: Request):
     """Serve the main HTML page."""
-    return FileResponse("static/index.html")
+    if IS_DEVELOPMENT:
+        return FileResponse("static/index.html")
+    headers = {"ETag": INDEX_ETAG, "Cache-Control": "public, max-age=300"}
+    if request.headers.get("if-none-match") == INDEX_ETAG:
+        return Response(status_code=304, headers=headers)
+    return Response(content=INDEX_HTML, media_type="text/html", headers=headers)
 
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
     try:
         await websocket.accept()
+        if agent_slots.locked():
+            logger.warning(f"At capacity, turning away client {client_id}")
+            await websocket.close(code=1013, reason="server busy")
+            return
         connections[client_id] = websocket
         logger.info(f"New WebSocket connection established for client {client_id}")
         
         # Create agent with websocket using async context
-        async with MealPlannerAgent() as agent:
+        async with agent_slots, MealPlannerAgent(session_id=client_id) as agent:
             agent.websocket = websocket
             agents[client_id] = agent
             
@@ -73,39 +105,58 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
             
             try:
                 while True:
-                    # Receive message from client
-                    data = await websocket.receive_text()
-                    message = json.loads(data)
+                    # Receive message from client, evicting sockets that go quiet
+                    data = await asyncio.wait_for(websocket.receive_text(), timeout=settings.WS_IDLE_TIMEOUT)
+                    try:
+                        message = json_loads(data)
+                    except ValueError:
+                        message = None
+                    # A malformed frame shouldn't end the planning session
+                    if not isinstance(message, dict) or not isinstance(message.get("content", ""), str):
+                        logger.warning(f"Ignoring malformed message from client {client_id}")
+                        continue
                     logger.debug(f"Received message from client {client_id}: {message}")
                     
-                    if message["type"] == "user_input":
+                    if message.get("type") == "user_input":
                         # Handle user input during the conversation
-                        if client_id in agents:
-                            await agent.user_input_queue.put(message["content"])
+                        if client_id in agents and not agent.submit_user_input(message.get("content", "")):
+                            logger.warning(f"Input queue full for client {client_id}, dropped oldest message")
                     
             except WebSocketDisconnect:
                 logger.info(f"Client {client_id} disconnected")
-                # Cancel planning task
-                planning_task.cancel()
-                try:
-                    await planning_task
-                except asyncio.CancelledError:
-                    pass
+            except asyncio.TimeoutError:
+                logger.info(f"Closing idle connection for client {client_id}")
+                # Tell the user why the session ended instead of just dropping it
+                idle = settings.WS_IDLE_TIMEOUT
+                # Whole minutes read best, anything else is given in seconds
+                amount, unit = (idle // 60, "minute") if idle % 60 == 0 else (idle, "second")
+                with contextlib.suppress(Exception):
+                    await agent.send_message(
+                        f"This session was closed after {amount} {unit}{'' if amount == 1 else 's'} without a reply. "
+                        "Refresh the page to start a new meal plan."
+                    )
+                    await websocket.close(code=1001, reason="idle timeout")
             except Exception as e:
                 logger.error(f"Error in websocket connection: {str(e)}")
+            finally:
+                # Whatever ended the connection, including this handler being
+                # cancelled, the planning task must not outlive it
                 if not planning_task.done():
                     planning_task.cancel()
-                    try:
-                        await planning_task
-                    except asyncio.CancelledError:
-                        pass
+                try:
+                    await planning_task
+                except asyncio.CancelledError:
+                    # Only the planning task's own cancellation is expected
+                    # here. This handler being cancelled (e.g. on shutdown)
+                    # cancels the awaited task too, so check for that as well.
+                    if not planning_task.cancelled() or asyncio.current_task().cancelling():
+                        raise
+                agent.websocket = None
     
     finally:
         # Clean up
-        if client_id in connections:
-            del connections[client_id]
-        if client_id in agents:
-            del agents[client_id]
+        connections.pop(client_id, None)
+        agents.pop(client_id, None)
         logger.info(f"Cleaned up resources for client {client_id}")
 
 async def handle_planning_session(agent: MealPlannerAgent, client_id: str):
@@ -120,11 +171,46 @@ async def handle_planning_session(agent: MealPlannerAgent, client_id: str):
         # Send error message to client
         if client_id in connections:
             websocket = connections[client_id]
-            await websocket.send_json({
+            await websocket.send_text(json_dumps({
                 "type": "error",
                 "content": f"An error occurred: {str(e)}"
-            })
+            }))
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    # uvloop and httptools aren't available on Windows, where uvicorn falls
+    # back to the stock asyncio loop and h11
+    fast = sys.platform != "win32"
+    loop = "uvloop" if fast else "auto"
+    # One process unless asked for more, matching the Procfile. Each worker
+    # has its own caches, connection pools and MAX_AGENTS /
+    # OPENAI_MAX_CONCURRENCY limits, so those multiply with WEB_CONCURRENCY,
+    # and every worker shares the one SQLite response cache.
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    
+    # Opt-in io_uring loop on Linux; uvicorn must then leave the policy alone.
+    # Worker processes re-import the app and wouldn't inherit the policy, so
+    # this runs a single process.
+    if sys.platform == "linux" and os.environ.get("EVENT_LOOP") == "uring":
+        try:
+            import uringcore
+            asyncio.set_event_loop_policy(uringcore.EventLoopPolicy())
+            loop = "none"
+            workers = 1
+        except ImportError:
+            logger.warning("uringcore is not installed, using uvloop")
+    
+    uvicorn.run(
+        "app:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=8000,
+        workers=workers,
+        loop=loop,
+        http="httptools" if fast else "auto",
+        ws="websockets",
+        # Protocol-level pings, answered by the browser itself, so half-open
+        # connections are dropped without the client having to cooperate
+        ws_ping_interval=30,
+        ws_ping_timeout=30,
+    ) 
\ No newline at end of file
@@ -1,5 +1,6 @@
 import os
 from dotenv import load_dotenv
+from pydantic import Field
 from pydantic_settings import BaseSettings
 
 # Load environment variables from .env file
@@ -14,9 +15,37 @@ class Settings(BaseSettings):
     
     # Edamam API endpoints
     EDAMAM_BASE_URL: str = "https://api.edamam.com/api/recipes/v2"
+    EDAMAM_MAX_CONCURRENCY: int = 8
+    EDAMAM_CACHE_SIZE: int = 256
+    EDAMAM_CACHE_TTL: int = 24 * 60 * 60  # seconds
+    EDAMAM_RECIPE_CACHE_SIZE: int = 2048
     
     # OpenAI settings
-    MODEL_NAME: str = "gpt-4-turbo-preview"
+    MODEL_NAME: str = "gpt-4o"
+    # Smaller model for mechanical parsing, like interpreting recipe selections
+    EXTRACTION_MODEL_NAME: str = "gpt-4o-mini"
+    # In-flight completions per worker process, shared by all its agents
+    OPENAI_MAX_CONCURRENCY: int = 32
+    # Attempts per completion, including the first, so at least one
+    OPENAI_MAX_RETRIES: int = Field(default=5, ge=1)
+    OPENAI_CACHE_SIZE: int = 1024
+    OPENAI_SEED: int = 42
+    # Enough for a preference summary or the submit_preferences arguments
+    OPENAI_MAX_REPLY_TOKENS: int = 400
+    OPENAI_MAX_HISTORY_MESSAGES: int = 20
+    
+    # On-disk cache of deterministic completions
+    LLM_CACHE_PATH: str = "data/llm_cache.db"
+    LLM_CACHE_TTL: int = 7 * 24 * 60 * 60  # seconds
+    LLM_CACHE_MAX_ROWS: int = 10000
+    LLM_CACHE_BUSY_TIMEOUT: float = 0.25  # seconds
+    
+    # Seconds without a message from the client before its socket is closed
+    WS_IDLE_TIMEOUT: int = 10 * 60
+    # Concurrent planning sessions per worker process
+    MAX_AGENTS: int = 200
+    # Pending websocket messages per agent before the oldest are dropped
+    USER_INPUT_QUEUE_SIZE: int = 32
     
     def validate_settings(self) -> None:
         """Validate that all required settings are set."""
@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+import httpx
+
+from tools.recipe import RecipeAPI
+
+
+def _hit(number: int) -> dict:
+    return {
+        "recipe": {
+            "uri": f"http://www.edamam.com/ontologies/edamam.owl#recipe_{number}",
+            "label": f"Recipe {number}",
+            "url": f"https://example.com/recipe-{number}",
+            "ingredients": [
+                {"food": "Rice", "quantity": 1.5, "measure": "cup", "weight": 280.0, "foodCategory": "grains"}
+            ],
+            "yield": 4.0,
+            "totalTime": 30.0,
+            "calories": 1200.5,
+        }
+    }
+
+
+def _search(body: bytes, chunk_size: int, max_results: int):
+    async def chunks():
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+
+    async def run():
+        api = RecipeAPI()
+        await api._client.aclose()
+        api._client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, content=chunks()))
+        )
+        try:
+            return await api._fetch_search({"type": "public", "q": "rice"}, max_results)
+        finally:
+            await api.aclose()
+
+    return asyncio.run(run())
+
+
+def test_fetch_search_parses_multi_chunk_body():
+    body = json.dumps({"from": 1, "to": 20, "hits": [_hit(n) for n in range(1, 21)]}).encode()
+    recipes = _search(body, chunk_size=64, max_results=5)
+    assert [recipe.name for recipe in recipes] == [f"Recipe {n}" for n in range(1, 6)]
+    assert recipes[0].servings == 4
+    assert recipes[0].ingredients[0].amount == 1.5
+
+
+def test_fetch_search_parses_single_chunk_body():
+    body = json.dumps({"hits": [_hit(n) for n in range(1, 4)]}).encode()
+    recipes = _search(body, chunk_size=len(body), max_results=10)
+    assert [recipe.name for recipe in recipes] == ["Recipe 1", "Recipe 2", "Recipe 3"]
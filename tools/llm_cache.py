@@ -0,0 +1,112 @@
+from typing import Optional
+import logging
+import os
+import sqlite3
+import threading
+import time
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Connection to the cache database, opened on first use. Calls run in worker
+# threads, so the connection is shared between them behind a lock.
+_connection: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+
+def _connect() -> sqlite3.Connection:
+    """Open the cache database, creating it if needed. Call with _lock held."""
+    global _connection
+    if _connection is None:
+        directory = os.path.dirname(settings.LLM_CACHE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Workers share the file, so wait only briefly for another's write
+        # lock; a busy cache is treated as a miss rather than stalling
+        connection = sqlite3.connect(
+            settings.LLM_CACHE_PATH,
+            timeout=settings.LLM_CACHE_BUSY_TIMEOUT,
+            check_same_thread=False
+        )
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS llm_cache (
+                    hash TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at INTEGER NOT NULL,
+                    expires_at INTEGER NOT NULL
+                )"""
+            )
+            # Expiry and the row cap both go oldest first
+            connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_expires_at ON llm_cache (expires_at)")
+        except sqlite3.Error:
+            connection.close()
+            raise
+        _connection = connection
+    return _connection
+
+def get(prompt_hash: str) -> Optional[str]:
+    """
+    Look up a cached response.
+    
+    Blocks on SQLite, so call it from a worker thread.
+    
+    Args:
+        prompt_hash: Hash of the request
+        
+    Returns:
+        The cached response if present and not expired, None otherwise,
+        including when the database can't be read
+    """
+    try:
+        with _lock:
+            row = _connect().execute(
+                "SELECT response FROM llm_cache WHERE hash = ? AND expires_at > ?",
+                (prompt_hash, int(time.time()))
+            ).fetchone()
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"LLM cache lookup failed: {e}")
+        return None
+    return row[0] if row else None
+
+def set(prompt_hash: str, response: str) -> None:
+    """
+    Store a response for LLM_CACHE_TTL seconds, keeping at most
+    LLM_CACHE_MAX_ROWS entries.
+    
+    Blocks on SQLite, so call it from a worker thread. Failures are logged
+    and otherwise ignored, the response is only ever an optimization.
+    
+    Args:
+        prompt_hash: Hash of the request
+        response: Serialized response
+    """
+    now = int(time.time())
+    try:
+        with _lock:
+            connection = _connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO llm_cache (hash, response, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                    (prompt_hash, response, now, now + settings.LLM_CACHE_TTL)
+                )
+                # Drop expired entries as new ones come in, then the oldest
+                # beyond the cap
+                connection.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+                connection.execute(
+                    """DELETE FROM llm_cache WHERE hash IN (
+                        SELECT hash FROM llm_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+                    )""",
+                    (settings.LLM_CACHE_MAX_ROWS,)
+                )
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"LLM cache write failed: {e}")
+
+def close() -> None:
+    """Close the cache database."""
+    global _connection
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
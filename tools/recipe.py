@@ -1,53 +1,82 @@
-from typing import List, Dict, Optional, Union
+from typing import List, Dict, Optional, Tuple, Union
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields
+import asyncio
+import inspect
+import json
+import sys
+import time
+import httpx
 import requests
-from pydantic import BaseModel, Field
 from config import settings
 
-class Measure(BaseModel):
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Plain slotted dataclasses: recipes come from Edamam's fixed schema and are
+# only read afterwards, so they don't need pydantic's validation or per-instance
+# __dict__
+
+@dataclass(slots=True, frozen=True)
+class Measure:
     """Model for ingredient measures."""
     uri: str
     label: str
     weight: float
 
-class Food(BaseModel):
+@dataclass(slots=True, frozen=True)
+class Food:
     """Model for food items."""
     foodId: str
     label: str
     
-class Ingredient(BaseModel):
+@dataclass(slots=True, frozen=True, kw_only=True)
+class Ingredient:
     """Model for recipe ingredients based on Edamam API spec."""
     foodId: Optional[str] = None
     quantity: str  # Store as string to handle both integers and decimals
-    measure: Optional[str] = Field(default="unit")
+    amount: Optional[float] = None  # quantity as a number, None if it isn't one
+    measure: Optional[str] = "unit"
     weight: Optional[float] = None
-    food: str
-    foodCategory: Optional[str] = None
+    food: str  # Lowercased when parsed, so ingredients match across recipes
+    foodCategory: Optional[str] = None  # "Other" when Edamam has none
 
-class RecipeImage(BaseModel):
+@dataclass(slots=True, frozen=True)
+class RecipeImage:
     """Model for recipe images."""
     url: str
     width: int
     height: int
 
-class RecipeImages(BaseModel):
+@dataclass(slots=True, frozen=True)
+class RecipeImages:
     """Model for different recipe image sizes."""
     THUMBNAIL: Optional[RecipeImage] = None
     SMALL: Optional[RecipeImage] = None
     REGULAR: Optional[RecipeImage] = None
     LARGE: Optional[RecipeImage] = None
 
-class Recipe(BaseModel):
+@dataclass(slots=True, frozen=True, kw_only=True)
+class Recipe:
     """Model for recipe data based on Edamam API spec."""
     id: str
     name: str
     url: str
     image: Optional[str]
     images: Optional[RecipeImages] = None
-    cuisine_type: List[str] = Field(default_factory=list)
-    meal_type: List[str] = Field(default_factory=list)
-    dish_type: List[str] = Field(default_factory=list)
-    diet_labels: List[str] = Field(default_factory=list)
-    health_labels: List[str] = Field(default_factory=list)
+    cuisine_type: List[str] = field(default_factory=list)
+    meal_type: List[str] = field(default_factory=list)
+    dish_type: List[str] = field(default_factory=list)
+    diet_labels: List[str] = field(default_factory=list)
+    health_labels: List[str] = field(default_factory=list)
     ingredients: List[Ingredient]
     servings: int
     total_time: Optional[int] = None  # in minutes
@@ -67,6 +96,26 @@ class RecipeAPI:
         self.headers = {
             "Edamam-Account-User": self.user_id
         }
+        # Reuse connections across searches instead of a new TLS handshake per call
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        # Async requests go through their own pool, sized to the concurrency
+        # limit, so they don't tie up worker threads
+        self._client = httpx.AsyncClient(
+            headers=self.headers,
+            http2=True,
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=settings.EDAMAM_MAX_CONCURRENCY,
+                max_keepalive_connections=settings.EDAMAM_MAX_CONCURRENCY
+            )
+        )
+        # Bound concurrent searches to respect Edamam's rate limits
+        self._semaphore = asyncio.Semaphore(settings.EDAMAM_MAX_CONCURRENCY)
+        # Recent search results by normalized parameters, with their expiry time
+        self._search_cache: "OrderedDict[Tuple, Tuple[float, List[Recipe]]]" = OrderedDict()
+        # Recipes fetched by ID; a recipe doesn't change, so these don't expire
+        self._recipe_cache: "OrderedDict[str, Recipe]" = OrderedDict()
 
     def search_recipes(
         self,
@@ -95,72 +144,100 @@ class RecipeAPI:
         Returns:
             List of Recipe objects
         """
-        params = {
-            "type": "public",
-            "app_id": self.app_id,
-            "app_key": self.app_key,
-            "q": query,
-            "beta": "true"  # Enable CO2 emissions data
-        }
-        
-        if diet:
-            params["diet"] = diet
-        if health:
-            params["health"] = health
-        if cuisine_type:
-            params["cuisineType"] = cuisine_type
-        if meal_type:
-            params["mealType"] = meal_type
-        if dish_type:
-            params["dishType"] = dish_type
-        if image_size:
-            params["imageSize"] = image_size.upper()
-            
-        response = requests.get(self.base_url, params=params, headers=self.headers)
+        params = self._search_params(query, diet, health, cuisine_type, meal_type, dish_type, image_size)
+        response = self.session.get(self.base_url, params=params)
         try:
             response.raise_for_status()
         except requests.exceptions.HTTPError as e:
-            print(f"Error Status Code: {response.status_code}")
-            print(f"Error Response Headers: {response.headers}")
-            print(f"Error Response Body: {response.text}")
+            self._report_error(response)
             raise
         
-        recipes = []
-        for hit in response.json().get("hits", [])[:max_results]:
-            recipe = hit["recipe"]
-            recipes.append(
-                Recipe(
-                    id=recipe["uri"].split("#")[-1],
-                    name=recipe["label"],
-                    url=recipe["url"],
-                    image=recipe.get("image"),
-                    images=RecipeImages(**recipe.get("images", {})) if recipe.get("images") else None,
-                    cuisine_type=recipe.get("cuisineType", []),
-                    meal_type=recipe.get("mealType", []),
-                    dish_type=recipe.get("dishType", []),
-                    diet_labels=recipe.get("dietLabels", []),
-                    health_labels=recipe.get("healthLabels", []),
-                    ingredients=[
-                        Ingredient(
-                            foodId=ing.get("foodId"),
-                            food=ing["food"],
-                            quantity=str(ing["quantity"]),
-                            measure=ing.get("measure") or "unit",
-                            weight=ing.get("weight"),
-                            foodCategory=ing.get("foodCategory")
-                        )
-                        for ing in recipe["ingredients"]
-                    ],
-                    servings=recipe["yield"],
-                    total_time=recipe.get("totalTime"),
-                    calories=recipe.get("calories"),
-                    total_nutrients=recipe.get("totalNutrients"),
-                    total_daily=recipe.get("totalDaily"),
-                    co2_emissions_class=recipe.get("co2EmissionsClass")
-                )
-            )
+        return [self._parse_recipe(hit["recipe"]) for hit in json_loads(response.content).get("hits", [])[:max_results]]
+
+    async def search_recipes_async(self, *args, **kwargs) -> List[Recipe]:
+        """
+        Search for recipes without blocking the event loop.
+        
+        Takes the same arguments as search_recipes, but requests go through an
+        async HTTP client, so any number of searches can wait on the network
+        without holding a worker thread. Results are cached for
+        EDAMAM_CACHE_TTL seconds, so repeated searches, from this or another
+        session, don't reach the API.
+        """
+        bound = _SEARCH_SIGNATURE.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        del arguments["self"]
+        
+        # List arguments are sorted so their order doesn't matter
+        key = tuple(
+            (name, tuple(sorted(value)) if isinstance(value, list) else value)
+            for name, value in arguments.items()
+        )
+        cached = self._search_cache.get(key)
+        if cached is not None:
+            expires_at, recipes = cached
+            if expires_at > time.monotonic():
+                self._search_cache.move_to_end(key)
+                return list(recipes)
+            del self._search_cache[key]
+        
+        max_results = arguments.pop("max_results")
+        recipes = await self._fetch_search(self._search_params(**arguments), max_results)
+        
+        self._search_cache[key] = (time.monotonic() + settings.EDAMAM_CACHE_TTL, recipes)
+        if len(self._search_cache) > settings.EDAMAM_CACHE_SIZE:
+            self._search_cache.popitem(last=False)
+        return list(recipes)
+
+    async def _fetch_search(self, params: Dict[str, Union[str, List[str]]], max_results: int) -> List[Recipe]:
+        """
+        Run a search and parse the first max_results hits.
         
-        return recipes
+        Search responses carry full nutrient data and run to hundreds of KB.
+        With ijson installed the body is parsed as it arrives, and the stream
+        is closed once enough hits are in, so the remaining hits are neither
+        downloaded nor decoded.
+        """
+        async with self._semaphore:
+            async with self._client.stream("GET", self.base_url, params=params) as response:
+                try:
+                    response.raise_for_status()
+                except httpx.HTTPStatusError:
+                    await response.aread()
+                    self._report_error(response)
+                    raise
+                
+                if ijson is None:
+                    hits = json_loads(await response.aread()).get("hits", [])
+                    return [self._parse_recipe(hit["recipe"]) for hit in hits[:max_results]]
+                
+                recipes = []
+                if max_results > 0:
+                    hits = ijson.items_async(_ResponseReader(response), "hits.item.recipe", use_float=True)
+                    async for recipe in hits:
+                        recipes.append(self._parse_recipe(recipe))
+                        if len(recipes) == max_results:
+                            break
+                return recipes
+
+    async def prewarm(self) -> None:
+        """
+        Open a connection to the Edamam API ahead of the first search.
+        
+        The response is ignored, the request only leaves a connection with a
+        completed TLS handshake in the async client's pool. Failures are left
+        for the real search to report.
+        """
+        try:
+            await self._client.head(self.base_url, timeout=5)
+        except httpx.HTTPError:
+            pass
+
+    async def aclose(self) -> None:
+        """Close the connection pools."""
+        await self._client.aclose()
+        self.session.close()
 
     def get_recipe_by_id(self, recipe_id: str) -> Optional[Recipe]:
         """
@@ -172,53 +249,201 @@ class RecipeAPI:
         Returns:
             Recipe object if found, None otherwise
         """
-        params = {
-            "type": "public",
-            "app_id": self.app_id,
-            "app_key": self.app_key,
-            "uri": f"http://www.edamam.com/ontologies/edamam.owl#recipe_{recipe_id}",
-            "beta": "true"  # Enable CO2 emissions data
-        }
+        recipe = self._cached_recipe(recipe_id)
+        if recipe is not None:
+            return recipe
         
-        response = requests.get(self.base_url, params=params, headers=self.headers)
+        response = self.session.get(self.base_url, params=self._recipe_params(recipe_id))
         try:
             if response.status_code == 404:
                 return None
             response.raise_for_status()
         except requests.exceptions.HTTPError as e:
-            print(f"Error Status Code: {response.status_code}")
-            print(f"Error Response Headers: {response.headers}")
-            print(f"Error Response Body: {response.text}")
+            self._report_error(response)
             raise
             
-        recipe_data = response.json()["hits"][0]["recipe"]
+        return self._remember_recipe(json_loads(response.content)["hits"][0]["recipe"], recipe_id)
+
+    async def get_recipe_by_id_async(self, recipe_id: str) -> Optional[Recipe]:
+        """Fetch a specific recipe by its ID without blocking the event loop."""
+        recipe = self._cached_recipe(recipe_id)
+        if recipe is not None:
+            return recipe
         
+        async with self._semaphore:
+            response = await self._client.get(self.base_url, params=self._recipe_params(recipe_id))
+        try:
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+        except httpx.HTTPStatusError:
+            self._report_error(response)
+            raise
+        
+        return self._remember_recipe(json_loads(response.content)["hits"][0]["recipe"], recipe_id)
+
+    async def get_recipes_by_ids(self, recipe_ids: List[str]) -> List[Optional[Recipe]]:
+        """
+        Fetch several recipes concurrently, in the order of recipe_ids.
+        
+        The lookups share the search semaphore, so a large batch still stays
+        within EDAMAM_MAX_CONCURRENCY requests at a time.
+        """
+        return list(await asyncio.gather(*(self.get_recipe_by_id_async(recipe_id) for recipe_id in recipe_ids)))
+
+    def _cached_recipe(self, recipe_id: str) -> Optional[Recipe]:
+        """Return a previously fetched recipe, marking it recently used."""
+        recipe = self._recipe_cache.get(recipe_id)
+        if recipe is not None:
+            self._recipe_cache.move_to_end(recipe_id)
+        return recipe
+
+    def _remember_recipe(self, data: dict, recipe_id: str) -> Recipe:
+        """Parse a fetched recipe and cache it, evicting the least recently used."""
+        recipe = self._parse_recipe(data, recipe_id=recipe_id)
+        self._recipe_cache[recipe_id] = recipe
+        if len(self._recipe_cache) > settings.EDAMAM_RECIPE_CACHE_SIZE:
+            self._recipe_cache.popitem(last=False)
+        return recipe
+
+    def _recipe_params(self, recipe_id: str) -> Dict[str, str]:
+        """Build the query parameters for a recipe lookup."""
+        return {
+            "type": "public",
+            "app_id": self.app_id,
+            "app_key": self.app_key,
+            "uri": f"http://www.edamam.com/ontologies/edamam.owl#recipe_{recipe_id}",
+            "beta": "true"  # Enable CO2 emissions data
+        }
+
+    def _search_params(
+        self,
+        query: str,
+        diet: Optional[List[str]],
+        health: Optional[List[str]],
+        cuisine_type: Optional[List[str]],
+        meal_type: Optional[List[str]],
+        dish_type: Optional[List[str]],
+        image_size: Optional[str]
+    ) -> Dict[str, Union[str, List[str]]]:
+        """Build the query parameters for a recipe search."""
+        params = {
+            "type": "public",
+            "app_id": self.app_id,
+            "app_key": self.app_key,
+            "q": query,
+            "beta": "true"  # Enable CO2 emissions data
+        }
+        
+        if diet:
+            params["diet"] = diet
+        if health:
+            params["health"] = health
+        if cuisine_type:
+            params["cuisineType"] = cuisine_type
+        if meal_type:
+            params["mealType"] = meal_type
+        if dish_type:
+            params["dishType"] = dish_type
+        if image_size:
+            params["imageSize"] = image_size.upper()
+        return params
+
+    @staticmethod
+    def _report_error(response) -> None:
+        """Print the details of a failed Edamam response."""
+        print(
+            f"Error Status Code: {response.status_code}\n"
+            f"Error Response Headers: {response.headers}\n"
+            f"Error Response Body: {response.text}"
+        )
+
+    @staticmethod
+    def _parse_recipe(recipe: dict, recipe_id: Optional[str] = None) -> Recipe:
+        """
+        Build a Recipe from an Edamam recipe object.
+        
+        Nothing validates the models, so numbers Edamam sends as floats are
+        converted here for the int fields.
+        """
+        images = recipe.get("images")
+        total_time = recipe.get("totalTime")
         return Recipe(
-            id=recipe_id,
-            name=recipe_data["label"],
-            url=recipe_data["url"],
-            image=recipe_data.get("image"),
-            images=RecipeImages(**recipe_data.get("images", {})) if recipe_data.get("images") else None,
-            cuisine_type=recipe_data.get("cuisineType", []),
-            meal_type=recipe_data.get("mealType", []),
-            dish_type=recipe_data.get("dishType", []),
-            diet_labels=recipe_data.get("dietLabels", []),
-            health_labels=recipe_data.get("healthLabels", []),
+            id=recipe_id or recipe["uri"].split("#")[-1],
+            name=recipe["label"],
+            url=recipe["url"],
+            image=recipe.get("image"),
+            images=RecipeImages(
+                **{size: RecipeImage(image["url"], image["width"], image["height"])
+                   for size, image in images.items() if size in _IMAGE_SIZES}
+            ) if images else None,
+            cuisine_type=recipe.get("cuisineType", []),
+            meal_type=recipe.get("mealType", []),
+            dish_type=recipe.get("dishType", []),
+            diet_labels=recipe.get("dietLabels", []),
+            health_labels=recipe.get("healthLabels", []),
             ingredients=[
                 Ingredient(
                     foodId=ing.get("foodId"),
-                    food=ing["food"],
+                    # Interned, since the same few foods, measures and
+                    # categories repeat across every cached recipe
+                    food=sys.intern(ing["food"].lower()),
                     quantity=str(ing["quantity"]),
-                    measure=ing.get("measure") or "unit",
+                    amount=_parse_amount(ing["quantity"]),
+                    measure=sys.intern(ing.get("measure") or "unit"),
                     weight=ing.get("weight"),
-                    foodCategory=ing.get("foodCategory")
+                    foodCategory=sys.intern(ing.get("foodCategory") or "Other")
                 )
-                for ing in recipe_data["ingredients"]
+                for ing in recipe["ingredients"]
             ],
-            servings=recipe_data["yield"],
-            total_time=recipe_data.get("totalTime"),
-            calories=recipe_data.get("calories"),
-            total_nutrients=recipe_data.get("totalNutrients"),
-            total_daily=recipe_data.get("totalDaily"),
-            co2_emissions_class=recipe_data.get("co2EmissionsClass")
-        ) 
\ No newline at end of file
+            servings=int(recipe["yield"]),
+            total_time=int(total_time) if total_time is not None else None,
+            calories=recipe.get("calories"),
+            total_nutrients=recipe.get("totalNutrients"),
+            total_daily=recipe.get("totalDaily"),
+            co2_emissions_class=recipe.get("co2EmissionsClass")
+        )
+
+def _parse_amount(quantity) -> Optional[float]:
+    """Convert an ingredient quantity to a float, or None if it isn't numeric."""
+    try:
+        return float(quantity)
+    except (ValueError, TypeError):
+        return None
+
+class _ResponseReader:
+    """Async file-like view of a streamed response body, for ijson."""
+    
+    def __init__(self, response: httpx.Response):
+        self._chunks = response.aiter_bytes()
+    
+    async def read(self, size: int = -1) -> bytes:
+        """Return the next chunk of the body, or b"" at the end."""
+        # ijson probes with read(0) to tell bytes from str and drops the
+        # result, so that must not consume a chunk
+        if size == 0:
+            return b""
+        try:
+            return await self._chunks.__anext__()
+        except StopAsyncIteration:
+            return b""
+
+_SEARCH_SIGNATURE = inspect.signature(RecipeAPI.search_recipes)
+_IMAGE_SIZES = frozenset(f.name for f in fields(RecipeImages))
+
+# Recipe API client shared by all agents, so searches reuse one connection pool
+_recipe_api: Optional[RecipeAPI] = None
+
+def get_recipe_api() -> RecipeAPI:
+    """Return the process-wide RecipeAPI, creating it if needed."""
+    global _recipe_api
+    if _recipe_api is None:
+        _recipe_api = RecipeAPI()
+    return _recipe_api
+
+async def close_recipe_api():
+    """Close the shared RecipeAPI and its connection pools."""
+    global _recipe_api
+    if _recipe_api is not None:
+        await _recipe_api.aclose()
+        _recipe_api = None
@@ -1,97 +1,115 @@
-from typing import List, Dict, Optional, Tuple
+from typing import Iterable, List, Dict, Optional, Tuple
+from operator import itemgetter
 from tools.recipe import Recipe
 
-def calculate_optimal_servings_distribution(recipes: List[Recipe], total_servings_needed: int) -> List[float]:
+# Smallest fraction of a recipe worth cooking when scaling it down
+MIN_SERVINGS_SCALE = 0.5
+
+def calculate_optimal_servings_distribution(recipes: List[Recipe], servings_per_meal: int) -> List[float]:
     """
-    Calculate optimal multipliers for each recipe to meet total servings needed with minimal excess.
+    Calculate optimal multipliers for each recipe so every meal serves exactly what's needed.
     
     Args:
-        recipes: List of recipes to adjust
-        total_servings_needed: Total servings needed for the week
+        recipes: List of recipes to adjust, one per meal
+        servings_per_meal: Servings needed for each meal
         
     Returns:
         List of multipliers for each recipe
     """
-    # Get base servings for each recipe
-    base_servings = [recipe.servings for recipe in recipes]
-    
-    # Calculate initial multipliers needed to meet servings per meal
-    initial_multipliers = [1.0 for _ in recipes]
-    total_servings = sum(s * m for s, m in zip(base_servings, initial_multipliers))
-    
-    # If we need more servings, scale up proportionally
-    if total_servings < total_servings_needed:
-        scale_factor = total_servings_needed / total_servings
-        return [m * scale_factor for m in initial_multipliers]
-    
-    # If we have too many servings, try to scale down while keeping reasonable portions
-    return initial_multipliers
+    # Each recipe is one meal, so it is scaled on its own yield rather than
+    # by a shared factor that would leave small recipes short. Scaling down
+    # stops at MIN_SERVINGS_SCALE of a recipe.
+    return [
+        max(MIN_SERVINGS_SCALE, calculate_servings_multiplier(recipe, servings_per_meal))
+        if recipe.servings > 0 else 1.0
+        for recipe in recipes
+    ]
 
 def calculate_servings_multiplier(recipe: Recipe, servings_needed: int) -> float:
     """Calculate the multiplier needed to scale recipe servings."""
     return servings_needed / recipe.servings
 
+def _format_quantity(quantity) -> str:
+    """Format a quantity, rounding floats to 2 decimal places without trailing zeros."""
+    if isinstance(quantity, float):
+        # Whole amounts, the common case when recipes aren't scaled, need no
+        # rounding or stripping
+        if quantity.is_integer():
+            return str(int(quantity))
+        return f"{quantity:.2f}".rstrip('0').rstrip('.')
+    return str(quantity)
+
 class ShoppingList:
     """Class to manage shopping list generation."""
     
     def __init__(self):
-        self.items = {}  # Dictionary to store consolidated ingredients
+        self.clear()
     
     def add_recipe(self, recipe: Recipe, servings_multiplier: float = 1.0):
         """Add a recipe's ingredients to the shopping list."""
-        for ingredient in recipe.ingredients:
-            # Convert ingredient to lowercase for consistent matching
-            food = ingredient.food.lower()
-            
-            # Calculate scaled quantity
-            try:
-                quantity = float(ingredient.quantity) * servings_multiplier
-            except (ValueError, TypeError):
-                # If quantity can't be converted to float, use original string
-                quantity = ingredient.quantity
-            
-            # Get measure and category
-            measure = ingredient.measure or "unit"
-            category = ingredient.foodCategory or "Other"
-            
-            # Create key for ingredient matching
-            key = (food, measure)
-            
-            if key in self.items:
-                # If quantity is numeric, add it
-                if isinstance(self.items[key]["quantity"], (int, float)) and isinstance(quantity, (int, float)):
-                    self.items[key]["quantity"] += quantity
+        self.add_recipes((recipe,), (servings_multiplier,))
+    
+    def add_recipes(self, recipes: Iterable[Recipe], servings_multipliers: Iterable[float]):
+        """Add several recipes' ingredients, each scaled by its multiplier, in one pass."""
+        self._consolidated = None
+        index, quantities = self._index, self._quantities
+        foods, measures, categories = self._foods, self._measures, self._categories
+        for recipe, servings_multiplier in zip(recipes, servings_multipliers):
+            for ingredient in recipe.ingredients:
+                # Calculate scaled quantity, keeping the original string if it
+                # isn't numeric
+                numeric = ingredient.amount is not None
+                quantity = ingredient.amount * servings_multiplier if numeric else ingredient.quantity
+                
+                # Ingredients match on food and measure, both normalized when parsed
+                key = (ingredient.food, ingredient.measure)
+                
+                i = index.get(key)
+                if i is not None:
+                    existing = quantities[i]
+                    # If both quantities are numeric, add them; a stored quantity
+                    # is a float unless it came from a string
+                    if numeric and existing.__class__ is float:
+                        quantities[i] = existing + quantity
+                    else:
+                        # If either quantity is a string, concatenate with a note
+                        quantities[i] = f"{existing} + {quantity}"
                 else:
-                    # If either quantity is a string, concatenate with a note
-                    self.items[key]["quantity"] = f"{self.items[key]['quantity']} + {quantity}"
-            else:
-                self.items[key] = {
-                    "food": food,
-                    "quantity": quantity,
-                    "measure": measure,
-                    "category": category
-                }
+                    index[key] = len(quantities)
+                    foods.append(key[0])
+                    measures.append(key[1])
+                    quantities.append(quantity)
+                    categories.append(ingredient.foodCategory)
     
     def clear(self):
         """Clear the shopping list."""
-        self.items = {}
+        # Consolidated ingredients as parallel columns, with the position of
+        # each (food, measure) pair
+        self._index: Dict[Tuple[str, str], int] = {}
+        self._foods: List[str] = []
+        self._measures: List[str] = []
+        self._quantities: list = []
+        self._categories: List[str] = []
+        # Output of get_consolidated_list, until the next add
+        self._consolidated: Optional[List[Dict[str, str]]] = None
     
     def get_consolidated_list(self) -> List[Dict[str, str]]:
-        """Get the consolidated shopping list."""
-        shopping_list = []
-        for item_data in self.items.values():
-            quantity = item_data["quantity"]
-            if isinstance(quantity, float):
-                # Round to 2 decimal places and remove trailing zeros
-                quantity_str = f"{quantity:.2f}".rstrip('0').rstrip('.')
-            else:
-                quantity_str = str(quantity)
-            
-            shopping_list.append({
-                "food": item_data["food"].title(),  # Capitalize food names
-                "quantity": quantity_str,
-                "measure": item_data["measure"],
-                "category": item_data["category"]
-            })
+        """Get the consolidated shopping list.
+        
+        Every item has food, quantity, measure and category keys, and the list
+        is sorted by category and then food, ignoring case. Food names are
+        capitalized. The list is reused until the
+        shopping list changes, so callers shouldn't modify it.
+        """
+        if self._consolidated is not None:
+            return self._consolidated
+        
+        # Sort plain tuples, and only build the item dicts in their final order
+        rows = list(zip(self._categories, self._foods, self._quantities, self._measures))
+        rows.sort(key=itemgetter(0, 1))
         
-        return sorted(shopping_list, key=lambda x: (x["category"], x["food"])) 
\ No newline at end of file
+        self._consolidated = [
+            {"food": food.title(), "quantity": _format_quantity(quantity), "measure": measure, "category": category}
+            for category, food, quantity, measure in rows
+        ]
+        return self._consolidated 
\ No newline at end of file
@@ -1,5 +1,9 @@
-from typing import List, Dict, Optional
-from pydantic import BaseModel
+from typing import List
+import re
+from pydantic import BaseModel, field_validator
+
+# Answers that mean the user has no dietary restrictions
+NO_RESTRICTIONS_PATTERN = re.compile(r"\s*(none|no\s+restrictions?|n/?a)\s*", re.IGNORECASE)
 
 class UserPreferences(BaseModel):
     """Model for storing user meal planning preferences."""
@@ -9,37 +13,16 @@ class UserPreferences(BaseModel):
     cooking_days: List[str]
     servings_per_meal: int = 1
 
-def collect_dietary_restrictions() -> List[str]:
-    """
-    Tool for collecting dietary restrictions from user input.
-    Returns a list of dietary restrictions.
-    """
-    # This will be called by the agent to collect dietary restrictions
-    return []
-
-def collect_meal_count() -> int:
-    """
-    Tool for collecting the number of meals needed.
-    Returns the number of meals to plan.
-    """
-    # This will be called by the agent to collect meal count
-    return 0
-
-def collect_cooking_days() -> List[str]:
-    """
-    Tool for collecting days available for cooking.
-    Returns a list of days.
-    """
-    # This will be called by the agent to collect cooking days
-    return []
-
-def collect_cuisine_preferences() -> List[str]:
-    """
-    Tool for collecting cuisine preferences.
-    Returns a list of preferred cuisines.
-    """
-    # This will be called by the agent to collect cuisine preferences
-    return []
+    @field_validator("dietary_restrictions", mode="before")
+    @classmethod
+    def no_restrictions_to_empty(cls, value):
+        """Convert "none" or "no restrictions" answers to an empty list."""
+        if isinstance(value, str):
+            return [] if NO_RESTRICTIONS_PATTERN.fullmatch(value) else value
+        if isinstance(value, list):
+            # Function arguments are always a list, possibly ["None"]
+            return [item for item in value if not (isinstance(item, str) and NO_RESTRICTIONS_PATTERN.fullmatch(item))]
+        return value
 
 def validate_preferences(preferences: UserPreferences) -> bool:
     """